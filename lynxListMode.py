@@ -6,6 +6,8 @@ import time
 
 from datetime import datetime
 
+from lynxProfiler import LynxProfiler
+
 from aspLibs.aspUtilities import IntRange
 from aspLibs.aspUtilities import V_NONE, V_HIGH
 from aspLibs.aspUtilities import DATA_DIR
@@ -51,25 +53,31 @@ def output_tlist(td, time_base, clear, fn):
 
     time_conversion = time_base / 1000  # Conversion to uS
 
-    nbr_events = len(td.getEvents())
+    events = td.getEvents()
+    nbr_events = len(events)
+    lines = []  # Decode the whole buffer first so decode and write can be timed separately
 
-    for event in td.getEvents():
-        event_dt = event.getTime()
-        event_nbr = event.getEvent()
-        if (event_dt & ROLLOVERBIT) == 0:  # Normal event
-            event_time = RolloverTime | (event_dt & ROLLOVERMASK)  # add new time increment
-        else:
-            # Rollover event - adjust clock
-            nbr_events -= 1  # This isn't a real event, so don't count
-            tc_lsb = int(0)
-            tc_msb = int(0)
-            tc_lsb |= (event_dt & ROLLOVERMASK) << 15  # Mask off the rollover bit and push up to the MSB
-            tc_msb |= event_nbr << 30  # During rollover, event_nbr has time info instead of event number
-            RolloverTime = tc_msb | tc_lsb  # Adjust our clock for larger time
-            continue  # goto next event, do not record this rollover
-
-        fn.write(f'{round(event_time * time_conversion, 1)},{event_nbr}\n')
-        time_acc += event_dt & ROLLOVERMASK
+    with profiler.span('decode'):
+        for event in events:
+            event_dt = event.getTime()
+            event_nbr = event.getEvent()
+            if (event_dt & ROLLOVERBIT) == 0:  # Normal event
+                event_time = RolloverTime | (event_dt & ROLLOVERMASK)  # add new time increment
+            else:
+                # Rollover event - adjust clock
+                nbr_events -= 1  # This isn't a real event, so don't count
+                tc_lsb = int(0)
+                tc_msb = int(0)
+                tc_lsb |= (event_dt & ROLLOVERMASK) << 15  # Mask off the rollover bit and push up to the MSB
+                tc_msb |= event_nbr << 30  # During rollover, event_nbr has time info instead of event number
+                RolloverTime = tc_msb | tc_lsb  # Adjust our clock for larger time
+                continue  # goto next event, do not record this rollover
+
+            lines.append(f'{round(event_time * time_conversion, 1)},{event_nbr}\n')
+            time_acc += event_dt & ROLLOVERMASK
+
+    with profiler.span('write'):
+        fn.writelines(lines)
     return nbr_events  # Indicate the number of events processed
 # End function definition
 
@@ -100,6 +108,12 @@ det_name = config['DETECTOR']['Name']
 det_serial = config['DETECTOR']['Sn']
 file_note1 = config['DATA']['File_Note1']
 file_note2 = config['DATA']['File_Note2']
+# Profiling section is optional so older config files keep working
+prof_dir = config.get('PROFILE', 'Control_Dir', fallback='.')
+prof_time = config.getfloat('PROFILE', 'Duration', fallback=30)
+prof_interval = config.getfloat('PROFILE', 'Interval', fallback=0.01)
+prof_stall = config.getfloat('PROFILE', 'Stall', fallback=0)
+prof_trace = config.getboolean('PROFILE', 'Trace', fallback=False)
 
 # Set up file naming structure
 # Time and date strings for filename
@@ -110,6 +124,10 @@ timestr = now.strftime('%H%M')
 file_nbr = 1  # Counter to keep track of file number
 file_events = 0  # Counter to keep track of events written in each file
 
+profiler = LynxProfiler(log, f'{DATA_DIR}/{datestr}', f'{file_pre}_{datestr}_{timestr}',
+                        prof_dir, prof_time, prof_interval, prof_stall)
+profiler.set_tracing(prof_trace)
+
 # Main loop
 try:
     # Setup the Python env
@@ -166,6 +184,7 @@ try:
     data_path = f'{DATA_DIR}/{datestr}'
     if not os.path.isdir(data_path):
         os.mkdir(data_path)
+    profiler.start()    # Output directory now exists, so profile requests can be honoured
 
     # Create info file
     iname = f'{data_path}/logInfo_{file_pre}_{datestr}_{timestr}.txt'
@@ -196,15 +215,18 @@ try:
     while True:
         iteration += 1
         # Get the status (see ./DataTypes/ParameterTypes.py for enumerations
-        status = device.getParameter(ParameterCodes.Input_Status, LYNXINPUT)
+        with profiler.span('getParameter'):
+            status = device.getParameter(ParameterCodes.Input_Status, LYNXINPUT)
         if (status & StatusBits.Busy) == 0 and (status & StatusBits.Waiting) == 0:
             # No longer acquiring data - time to exit
             break
-        fault = device.getParameter(ParameterCodes.Input_Fault, LYNXINPUT)
+        with profiler.span('getParameter'):
+            fault = device.getParameter(ParameterCodes.Input_Fault, LYNXINPUT)
         # Not sure if we should act on a fault or not - TBD
 
         # Get the list data
-        t_list = device.getListData(LYNXINPUT)
+        with profiler.span('getListData'):
+            t_list = device.getListData(LYNXINPUT)
         log.disp(f'Start time: {t_list.getStartTime()}')
         if acq_mode == 'Live':
             log.disp(f'Live time (s): {t_list.getLiveTime() / 1e6}')
@@ -218,16 +240,17 @@ try:
         file_events += events_processed
         total_events += events_processed
         if (file_events > float(file_chunk)) & (float(file_chunk) != -1):  # Time to start a new file
-            ifile = open(iname, 'a')
-            ifile.write(f'{fname } ({file_events} events)\n')    # Record file info
-            ifile.close()
-            f.close()
-            file_nbr += 1
-            fname = f'{data_path}/{file_pre}_{datestr}_{timestr}_{file_nbr}.{file_post}'
-            log.info(f'Starting new file ({fname}) after writing {file_events} events')
-            file_events = 0
-            f = open(fname, 'w')
-            f.write(COL_HEADER)
+            with profiler.span('rotate'):
+                ifile = open(iname, 'a')
+                ifile.write(f'{fname } ({file_events} events)\n')    # Record file info
+                ifile.close()
+                f.close()
+                file_nbr += 1
+                fname = f'{data_path}/{file_pre}_{datestr}_{timestr}_{file_nbr}.{file_post}'
+                log.info(f'Starting new file ({fname}) after writing {file_events} events')
+                file_events = 0
+                f = open(fname, 'w')
+                f.write(COL_HEADER)
 
     log.info(f'Acquisition complete : total events = {total_events}')
     ifile = open(iname, 'a')
@@ -238,3 +261,5 @@ try:
 
 except Exception as e:
     Utilities.dumpException(e)
+finally:
+    profiler.stop()     # Flush any span summary still being collected
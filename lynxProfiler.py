@@ -0,0 +1,235 @@
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+
+from collections import Counter
+
+PROFILE_FILE = 'lynx_profile'   # Touch this file to start a sampling profile
+TRACE_FILE = 'lynx_trace'       # Create this file to enable timing spans, remove it to disable
+POLL_PERIOD = 1.0               # Seconds between checks of the control files
+
+
+class _NullSpan:
+    """
+    Do-nothing span handed out while tracing is off, so the hot path only pays for one attribute check.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    """
+    Times one pass through a block and hands the result back to the owning profiler.
+    """
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.profiler._record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class LynxProfiler:
+    """
+    Description:
+        On-demand diagnostics for a running acquisition. Nothing here costs anything until it is
+        switched on, and everything can be switched on and off without restarting the program.
+
+        Sampling profile:   send SIGUSR1 (where the OS supports it) or touch the PROFILE_FILE in the
+                            control directory. The main thread's stack is sampled for 'duration' seconds
+                            and the counts are written in collapsed-stack form (one 'a;b;c count' line per
+                            unique stack, usable by flamegraph tools).
+        Timing spans:       send SIGUSR2 to toggle, or create/remove the TRACE_FILE in the control
+                            directory. While on, blocks wrapped in span() are timed and a summary
+                            (count, total, mean, max) is logged and written out when tracing is turned off.
+
+        Control files are watched from a background thread, so requests are picked up even if the
+        main loop is stuck inside a blocking device call.
+    Arguments:
+        log (in, AspLogger)     Logger for status messages
+        out_dir (in, str)       Directory to write profile and trace summaries to
+        tag (in, str)           String included in output filenames
+        control_dir (in, str)   Directory watched for control files
+        duration (in, float)    Length of a sampling profile (s)
+        interval (in, float)    Time between stack samples (s)
+        stall (in, float)       Spans longer than this (s) are logged as they happen (0 to disable)
+    """
+    def __init__(self, log, out_dir, tag, control_dir='.', duration=30.0, interval=0.01, stall=0.0):
+        self.log = log
+        self.out_dir = out_dir
+        self.tag = tag
+        self.control_dir = control_dir
+        self.duration = duration
+        self.interval = interval
+        self.stall = stall
+        self.tracing = False
+        self._spans = {}
+        self._lock = threading.RLock()   # Re-entrant: signal handlers run on the main thread
+        self._main_id = threading.main_thread().ident
+        self._sampler = None
+        self._file_nbr = 0  # Sequence number so repeated dumps never overwrite each other
+        self._stop = threading.Event()
+        self._watcher = threading.Thread(target=self._watch, name='lynx-profiler-watch', daemon=True)
+
+    def start(self):
+        """
+        Description:
+            Install the signal handlers (where available) and start watching for control files
+        Return:
+            none
+        """
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, lambda signum, frame: self.profile())
+        if hasattr(signal, 'SIGUSR2'):
+            signal.signal(signal.SIGUSR2, lambda signum, frame: self.set_tracing(not self.tracing))
+        self._watcher.start()
+        self.log.info(f'Profiling hooks active : touch {os.path.join(self.control_dir, PROFILE_FILE)} '
+                      f'to profile, create {os.path.join(self.control_dir, TRACE_FILE)} to trace')
+
+    def stop(self):
+        """
+        Description:
+            Stop watching for control files and flush any span data collected so far
+        Return:
+            none
+        """
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        if self.tracing:
+            self.set_tracing(False)
+
+    def span(self, name):
+        """
+        Description:
+            Context manager timing the enclosed block while tracing is on
+        Arguments:
+            name (in, str)  Label the timing is accumulated under
+        Return:
+            A context manager
+        """
+        if not self.tracing:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def set_tracing(self, enable):
+        """
+        Description:
+            Turn the timing spans on or off. Turning them off writes out the summary.
+        Arguments:
+            enable (in, bool)   New tracing state
+        Return:
+            none
+        """
+        if enable == self.tracing:
+            return
+        if enable:
+            with self._lock:
+                self._spans = {}
+            self.tracing = True
+            self.log.info('Span tracing enabled')
+        else:
+            self.tracing = False
+            self._write_spans()
+
+    def profile(self):
+        """
+        Description:
+            Start a sampling profile of the main thread, unless one is already running
+        Return:
+            none
+        """
+        if self._sampler is not None and self._sampler.is_alive():
+            self.log.warn('Profile already in progress - request ignored')
+            return
+        self._sampler = threading.Thread(target=self._sample, name='lynx-profiler-sample', daemon=True)
+        self._sampler.start()
+
+    def _record(self, name, elapsed):
+        with self._lock:
+            stats = self._spans.get(name)
+            if stats is None:
+                self._spans[name] = [1, elapsed, elapsed]
+            else:
+                stats[0] += 1
+                stats[1] += elapsed
+                if elapsed > stats[2]:
+                    stats[2] = elapsed
+        if self.stall and elapsed > self.stall:
+            self.log.warn(f'Stall : {name} took {elapsed * 1000:.1f} ms')
+
+    def _write_spans(self):
+        with self._lock:
+            spans = self._spans
+            self._spans = {}
+        if not spans:
+            self.log.info('Span tracing disabled : no spans recorded')
+            return
+        lines = ['span,count,total_ms,mean_ms,max_ms\n']
+        for name, (count, total, worst) in sorted(spans.items(), key=lambda s: s[1][1], reverse=True):
+            lines.append(f'{name},{count},{total * 1000:.3f},{total * 1000 / count:.3f},{worst * 1000:.3f}\n')
+        fname = self._filename('trace', 'csv')
+        try:
+            with open(fname, 'w') as f:
+                f.writelines(lines)
+        except OSError as e:
+            self.log.erro(f'Unable to write span summary "{fname}" : {e}')
+            return
+        self.log.info(f'Span tracing disabled : summary written to {fname}')
+        for line in lines[1:]:
+            self.log.disp(line.rstrip())
+
+    def _sample(self):
+        self.log.info(f'Profiling main thread for {self.duration} s')
+        stacks = Counter()
+        nbr_samples = 0
+        end = time.monotonic() + self.duration
+        while time.monotonic() < end and not self._stop.is_set():
+            frame = sys._current_frames().get(self._main_id)
+            if frame is not None:
+                stack = traceback.extract_stack(frame)
+                stacks[';'.join(f'{os.path.basename(fs.filename)}:{fs.name}:{fs.lineno}' for fs in stack)] += 1
+                nbr_samples += 1
+            del frame
+            time.sleep(self.interval)
+        fname = self._filename('profile', 'txt')
+        with open(fname, 'w') as f:
+            for stack, count in stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        self.log.info(f'Profile complete : {nbr_samples} samples written to {fname}')
+
+    def _watch(self):
+        profile_path = os.path.join(self.control_dir, PROFILE_FILE)
+        trace_path = os.path.join(self.control_dir, TRACE_FILE)
+        trace_seen = False
+        while not self._stop.wait(POLL_PERIOD):
+            try:
+                if os.path.exists(profile_path):
+                    os.remove(profile_path)     # Consume the request so it only fires once
+                    self.profile()
+                trace_now = os.path.exists(trace_path)
+                if trace_now != trace_seen:     # Only act on changes so SIGUSR2 toggles are not undone
+                    trace_seen = trace_now
+                    self.set_tracing(trace_now)
+            except Exception as e:
+                self.log.erro(f'Profiler control error : {e}')
+
+    def _filename(self, kind, ext):
+        with self._lock:
+            self._file_nbr += 1
+            return f'{self.out_dir}/{kind}_{self.tag}_{self._file_nbr}.{ext}'